@@ -9,6 +9,8 @@
 
 import streamlit as st
 import difflib
+import hashlib
+import itertools
 from typing import Optional, Dict, List, Tuple
 import re
 
@@ -20,15 +22,16 @@ try:
 except ImportError:
     BS4_AVAILABLE = False
 
+# lxml is probed first: it is the fastest BeautifulSoup backend by a wide margin
 try:
-    import html5lib  # noqa: F401
-    PARSER_ORDER.append("html5lib")
+    import lxml  # noqa: F401
+    PARSER_ORDER.append("lxml")
 except Exception:
     pass
 
 try:
-    import lxml  # noqa: F401
-    PARSER_ORDER.append("lxml")
+    import html5lib  # noqa: F401
+    PARSER_ORDER.append("html5lib")
 except Exception:
     pass
 
@@ -38,6 +41,22 @@ PARSER_ORDER.append("html.parser")  # always available
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 PREVIEW_LENGTH = 500
 FULL_DISPLAY_THRESHOLD = 10000
+MAX_DIFF_SIZE = 100 * 1024  # 100KB; line diffs are quadratic in the worst case, larger inputs get a summary
+DIFF_SUMMARY_CHUNK = 4096  # chars compared per step when summarizing a large diff
+MAX_FULL_RENDER_SIZE = 1024 * 1024  # 1MB; expander contents are sent to the browser even while collapsed
+MAX_HIGHLIGHT_SIZE = 200 * 1024  # 200KB; larger full views are shown without syntax highlighting
+
+# Gutenberg block comment with padding around the body: <!--  wp:paragraph  -->
+# The body ends on its last non-space character (or is a single space right
+# after "wp:"), so the trailing \s+ is tried once instead of at every position
+# of a lazy [^>]+? - which went quadratic on long whitespace runs.
+WP_COMMENT_SPACING_RE = re.compile(r'<!--\s+(/?wp:(?:[^>]*[^>\s]|\s))\s+-->')
+
+# Final cleanup patterns, applied in this order by _fix_soup()
+EMPTY_P_SPAN_RE = re.compile(r'<p>\s*<span>\s*</span>\s*</p>\s*')
+EMPTY_P_SPAN_TIGHT_RE = re.compile(r'<p><span></span></p>\s*')
+WP_PARAGRAPH_PAIR_TIGHT_RE = re.compile(r'<!--/wp:paragraph-->\s*<!--\s*wp:paragraph\s*-->')
+WP_PARAGRAPH_PAIR_RE = re.compile(r'<!--\s*/wp:paragraph\s*-->\s*<!--\s*wp:paragraph\s*-->')
 
 # ---------------- App Config ----------------
 st.set_page_config(page_title="HTML Content Fixer", page_icon="🔧", layout="wide")
@@ -84,90 +103,134 @@ if not BS4_AVAILABLE:
     st.stop()
 
 # ---------------- Utilities ----------------
-BLOCK_LEVEL_TAGS = {
+BLOCK_LEVEL_TAGS = frozenset({
     "div", "section", "article", "aside", "header", "footer", "main", "nav",
     "ul", "ol", "li", "dl", "dt", "dd",
     "table", "thead", "tbody", "tfoot", "tr", "th", "td", "caption",
     "figure", "figcaption",
     "blockquote", "pre", "hr",
     "h1", "h2", "h3", "h4", "h5", "h6"
-}
-NON_EMPTY_INLINE_OK = {"img", "svg", "iframe", "video", "audio", "canvas", "embed", "object"}
+})
+NON_EMPTY_INLINE_OK = frozenset({"img", "svg", "iframe", "video", "audio", "canvas", "embed", "object"})
+
+# Gutenberg block delimiter text (comment body without <!-- -->): "wp:..." or "/wp:..."
+# Group 1 is "/" for a closing delimiter, "" for an opening one.
+WP_COMMENT_TEXT_RE = re.compile(r'\s*(/?)wp:')
 
 def pick_parser() -> str:
     return PARSER_ORDER[0] if PARSER_ORDER else "html.parser"
 
+def is_wp_comment_text(text: str) -> bool:
+    """True if comment text is a Gutenberg block delimiter (leading whitespace ignored)."""
+    return WP_COMMENT_TEXT_RE.match(text) is not None
+
+def is_blank_text(text: str) -> bool:
+    """True if text is empty or whitespace only (NBSP counts as whitespace)."""
+    return not text or text.isspace()
+
+# Node types that make up almost every tree. Hot loops dispatch on type(node)
+# identity and only fall back to _node_kind() for the rest (CData, Script, ...).
+_COMMON_NODE_TYPES = frozenset({Tag, NavigableString, Comment})
+
+def _node_kind(node: object) -> Optional[type]:
+    """Map a tree node to Tag, Comment or NavigableString (Comment before its base class)."""
+    if isinstance(node, Comment):
+        return Comment
+    if isinstance(node, NavigableString):
+        return NavigableString
+    if isinstance(node, Tag):
+        return Tag
+    return None
+
+# classify_p() flags
+P_WP_ONLY = 1          # only Gutenberg/blank comments, <br> and whitespace
+P_EMPTY = 2            # no visible text and no media (br is ignored)
+P_BLOCK_WRAPPED = 4    # has a block-level child
+
+def _has_visible_descendant(tag: Tag) -> bool:
+    """
+    True as soon as a descendant is a media tag or non-blank text (comments ignored).
+    Stops at the first hit instead of building the whole get_text() string.
+    """
+    for d in tag.descendants:
+        kind = type(d)
+        if kind not in _COMMON_NODE_TYPES:
+            kind = _node_kind(d)
+        if kind is Tag:
+            if d.name in NON_EMPTY_INLINE_OK:
+                return True
+        elif kind is NavigableString and not is_blank_text(d):
+            return True
+    return False
+
+def _inline_has_content(tag: Tag) -> bool:
+    """True if a non-<br> child tag of a <p> carries visible text or media."""
+    if tag.name in NON_EMPTY_INLINE_OK:
+        return True  # has meaningful media content
+
+    # Catches empty <span>, <em>, <strong>, <a>, etc.
+    return _has_visible_descendant(tag)
+
+def classify_p(p: Tag) -> int:
+    """
+    Classify a <p> in a single walk over its children.
+    Returns a bitmask of P_WP_ONLY, P_EMPTY and P_BLOCK_WRAPPED.
+    """
+    wp_only = True
+    empty = True
+    block_wrapped = False
+    for child in p.contents:
+        kind = type(child)
+        if kind not in _COMMON_NODE_TYPES:
+            kind = _node_kind(child)
+        if kind is Tag:
+            if child.name == "br":
+                continue  # ignore line breaks
+            wp_only = False
+            if child.name in BLOCK_LEVEL_TAGS:
+                block_wrapped = True
+            if empty and _inline_has_content(child):
+                empty = False
+        elif kind is NavigableString:
+            if not is_blank_text(child):
+                wp_only = empty = False
+        elif kind is Comment:
+            blank = is_blank_text(child)
+            if not (blank or is_wp_comment_text(child)):
+                wp_only = False
+            if not blank:
+                empty = False
+        else:
+            wp_only = False
+
+        if block_wrapped and not (wp_only or empty):
+            break  # nothing left to learn
+
+    flags = P_BLOCK_WRAPPED if block_wrapped else 0
+    if wp_only:
+        flags |= P_WP_ONLY
+    if empty:
+        flags |= P_EMPTY
+    return flags
+
 def is_effectively_empty(tag: Tag) -> bool:
     """
     True if <p> has no visible text and no meaningful inline content (br is ignored).
     This includes paragraphs with only empty inline tags like <span></span>, <em></em>, etc.
     """
-    for child in tag.children:
-        if isinstance(child, Tag):
-            if child.name == "br":
-                continue  # ignore line breaks
-            if child.name in NON_EMPTY_INLINE_OK:
-                return False  # has meaningful media content
-            
-            # Recursively check if the child tag has any content
-            # This catches empty <span>, <em>, <strong>, <a>, etc.
-            child_text = child.get_text(separator="", strip=True)
-            child_text = child_text.replace("\xa0", "").replace("&nbsp;", "").strip()
-            if child_text:
-                return False  # child has text content
-            
-            # Check if child has any meaningful descendants (images, etc.)
-            if any(isinstance(d, Tag) and d.name in NON_EMPTY_INLINE_OK for d in child.descendants):
-                return False
-                
-        if isinstance(child, NavigableString) and child.strip():
-            return False
-    
-    # Final check: get all text from tag and descendants
-    text = tag.get_text(separator="", strip=True)
-    text = text.replace("\xa0", "").replace("&nbsp;", "").strip()
-    return text == ""
+    return bool(classify_p(tag) & P_EMPTY)
 
 def unwrap_children(tag: Tag, child_name: str) -> int:
-    """Unwrap specific nested children of a tag (used for nested <p>)."""
-    changed = 0
-    nested = tag.find_all(child_name, recursive=True)
-    for n in nested:
-        if n is not tag:
-            n.unwrap()
-            changed += 1
-    return changed
-
-def unwrap_p_around_block(p_tag: Tag) -> int:
-    """If a <p> wraps block-level tags, unwrap the <p> entirely."""
-    for c in p_tag.children:
-        if isinstance(c, Tag) and c.name in BLOCK_LEVEL_TAGS:
-            p_tag.unwrap()
-            return 1
-    return 0
-
-def p_is_wp_comment_wrapper(p: Tag) -> bool:
     """
-    Return True if this <p> contains ONLY:
-      - Gutenberg comments like <!-- wp:... --> or <!-- /wp:... -->
-      - optional <br> tags
-      - whitespace / NBSP
+    Unwrap specific nested children of a tag (used for nested <p>).
+    Targets are collected first and unwrapped last-to-first, so each unwrap
+    splices near the end of its parent's child list.
+    A plain descendants filter is ~3x faster than find_all() for this.
     """
-    for child in p.contents:
-        if isinstance(child, NavigableString):
-            if str(child).replace("\xa0", " ").strip():
-                return False
-        elif isinstance(child, Comment):
-            s = str(child).strip()
-            if not (s.startswith("wp:") or s.startswith("/wp:")):
-                return False
-        elif isinstance(child, Tag):
-            if child.name == "br":
-                continue
-            return False
-        else:
-            return False
-    return True
+    nested = [d for d in tag.descendants if isinstance(d, Tag) and d.name == child_name]
+    for n in reversed(nested):
+        n.unwrap()
+    return len(nested)
 
 def extract_comments_from_p_tags(soup: BeautifulSoup) -> int:
     """
@@ -177,22 +240,19 @@ def extract_comments_from_p_tags(soup: BeautifulSoup) -> int:
     fixed_count = 0
     
     for p in soup.find_all("p"):
-        # Find all comment children
-        comments_to_move = []
-        for child in list(p.children):
-            if isinstance(child, Comment):
-                comment_text = str(child).strip()
-                if comment_text.startswith("wp:") or comment_text.startswith("/wp:"):
-                    comments_to_move.append(child)
+        # Find all comment children (p.contents is read as-is; nothing moves until below)
+        comments_to_move = [
+            child for child in p.contents
+            if isinstance(child, Comment) and is_wp_comment_text(child)
+        ]
         
         if comments_to_move:
-            # Move comments outside the paragraph
+            # Move comments outside the paragraph as one batch, right after it.
+            # A single insert_after keeps them in document order.
             for comment in comments_to_move:
-                # Extract the comment
                 comment.extract()
-                # Insert it after the paragraph
-                p.insert_after(comment)
-                fixed_count += 1
+            p.insert_after(*comments_to_move)
+            fixed_count += len(comments_to_move)
             
             # If paragraph is now empty (only had comments and maybe br tags), remove it
             if is_effectively_empty(p):
@@ -202,55 +262,55 @@ def extract_comments_from_p_tags(soup: BeautifulSoup) -> int:
 
 def normalize_paragraphs(soup: BeautifulSoup, remove_empty: bool, unwrap_block_wrapped_p: bool):
     """
-    Recursively:
+    In a single pass:
       - Extract Gutenberg comments from inside <p> tags
       - Unwrap nested <p> inside <p>
       - Remove <p> that are ONLY Gutenberg comment wrappers
       - Optionally remove empty <p>
       - Optionally unwrap <p> that wrap block-level elements
+
+    <p> tags are visited in document order, so an outermost <p> unwraps all of
+    its nested <p> before they are reached; those are then skipped as detached.
+    No rule can create a new nested <p>, so one pass reaches the fixed point.
     """
     total_nested_fixes = 0
     total_empty_removed = 0
     total_unwrapped_block = 0
     total_wp_comment_wrapper_removed = 0
-    total_comments_extracted = 0
-    changed = True
-    safety_counter = 0
 
-    # First pass: extract comments from inside p tags
+    # First: extract comments from inside p tags
     total_comments_extracted = extract_comments_from_p_tags(soup)
 
-    while changed and safety_counter < 50:
-        changed = False
-        safety_counter += 1
-        p_tags = list(soup.find_all("p"))
-        for p in p_tags:
-            # 1) remove pure Gutenberg-comment wrappers
-            if p_is_wp_comment_wrapper(p):
-                p.decompose()
-                total_wp_comment_wrapper_removed += 1
-                changed = True
-                continue
+    for p in soup.find_all("p"):
+        if p.parent is None:
+            continue  # unwrapped into an ancestor <p> or removed with it
+
+        # 1) unwrap nested <p> within <p> (a wrapper-only <p> never has any)
+        total_nested_fixes += unwrap_children(p, "p")
 
-            # 2) unwrap nested <p> within <p>
-            nested_count = unwrap_children(p, "p")
-            if nested_count:
-                total_nested_fixes += nested_count
-                changed = True
-
-            # 3) unwrap <p> that contains block elements
-            if unwrap_block_wrapped_p and p.parent:
-                unwrapped = unwrap_p_around_block(p)
-                if unwrapped:
-                    total_unwrapped_block += unwrapped
-                    changed = True
-                    continue
-
-            # 4) remove empty <p>
-            if remove_empty and p and p.name == "p" and is_effectively_empty(p):
+        flags = classify_p(p)
+
+        # 2) remove pure Gutenberg-comment wrappers
+        if flags & P_WP_ONLY:
+            # Block delimiters can land here when extraction moved them out of a
+            # nested <p>; drop the wrapper but keep them. Otherwise remove it all.
+            if any(isinstance(c, Comment) and is_wp_comment_text(c) for c in p.contents):
+                p.unwrap()
+            else:
                 p.decompose()
-                total_empty_removed += 1
-                changed = True
+            total_wp_comment_wrapper_removed += 1
+            continue
+
+        # 3) unwrap <p> that contains block elements
+        if unwrap_block_wrapped_p and flags & P_BLOCK_WRAPPED:
+            p.unwrap()
+            total_unwrapped_block += 1
+            continue
+
+        # 4) remove empty <p>
+        if remove_empty and flags & P_EMPTY:
+            p.decompose()
+            total_empty_removed += 1
 
     return {
         "nested_p_fixed": total_nested_fixes,
@@ -258,132 +318,137 @@ def normalize_paragraphs(soup: BeautifulSoup, remove_empty: bool, unwrap_block_w
         "block_wraps_unwrapped": total_unwrapped_block,
         "wp_comment_wrapper_removed": total_wp_comment_wrapper_removed,
         "comments_extracted_from_p": total_comments_extracted,
-        "iterations": safety_counter
+        "iterations": 1
     }
 
 def _node_has_visible_content(node: object) -> bool:
     """Does this node (or any of its descendants) render something visible?"""
     if isinstance(node, NavigableString):
-        return bool(str(node).strip())
+        return not is_blank_text(node)
     if isinstance(node, Comment):
         return False
     if isinstance(node, Tag):
-        if node.name in {"img", "svg", "video", "audio", "canvas", "iframe", "object", "embed"}:
-            return True
-        if node.get_text(strip=True):
+        if node.name in NON_EMPTY_INLINE_OK:
             return True
         for d in node.descendants:
-            if isinstance(d, Tag) and d.name in {"img", "svg", "video", "audio", "canvas", "iframe", "object", "embed"}:
-                return True
-            if isinstance(d, NavigableString) and str(d).strip():
-                return True
+            kind = type(d)
+            if kind not in _COMMON_NODE_TYPES:
+                kind = _node_kind(d)
+            if kind is Tag:
+                if d.name in NON_EMPTY_INLINE_OK:
+                    return True
+            elif kind is not None:
+                # comments nested inside a block still count as content here
+                if not is_blank_text(d):
+                    return True
         return False
     return False
 
 def remove_empty_gutenberg_blocks(soup: BeautifulSoup) -> int:
-    """Remove empty Gutenberg blocks at the top level."""
+    """
+    Remove empty Gutenberg blocks at the top level.
+
+    One forward walk over the siblings: remember the latest <!-- wp:* --> opener
+    with nothing visible after it, and drop opener..closer when the next
+    <!-- /wp:* --> arrives. Any visible node (another opener included) cancels it.
+    """
     container = soup.body if getattr(soup, "body", None) else soup
     removed = 0
-    i = 0
-    nodes = list(container.children)
-
-    while i < len(nodes):
-        n = nodes[i]
-        if isinstance(n, Comment) and str(n).strip().startswith("wp:"):
-            j = i + 1
-            content_has_any = False
-            while j < len(nodes):
-                m = nodes[j]
-                if isinstance(m, Comment) and str(m).strip().startswith("/wp:"):
-                    break
-                if _node_has_visible_content(m):
-                    content_has_any = True
-                j += 1
-
-            if j < len(nodes) and not content_has_any:
-                for k in range(i, j + 1):
-                    try:
-                        nodes[k].extract()
-                    except Exception:
-                        pass
+    open_start = None
+    node = container.contents[0] if container.contents else None
+
+    while node is not None:
+        next_node = node.next_sibling
+        delimiter = WP_COMMENT_TEXT_RE.match(node) if isinstance(node, Comment) else None
+        if delimiter is not None:
+            if not delimiter.group(1):  # <!-- wp:* -->
+                open_start = node
+            elif open_start is not None:  # <!-- /wp:* --> closing an empty block
+                cur = open_start
+                while cur is not next_node:
+                    following = cur.next_sibling
+                    cur.extract()
+                    cur = following
                 removed += 1
-                nodes = list(container.children)
-                continue
-        i += 1
+                open_start = None
+            node = next_node
+            continue
+        if open_start is not None and _node_has_visible_content(node):
+            open_start = None
+        node = next_node
     return removed
 
-def analyze_issues(html: str, parser: str) -> Dict:
-    """Analyze HTML for common issues."""
-    try:
-        soup = BeautifulSoup(html, parser)
-        nested = 0
-        block_wraps = 0
-        empties = 0
-        empty_with_span = 0
-        wp_comment_wrappers = 0
-        comments_in_p = 0
+def analyze_soup(soup: BeautifulSoup) -> Dict:
+    """Count common issues in an already-parsed, not yet fixed tree."""
+    nested = 0
+    block_wraps = 0
+    empties = 0
+    empty_with_span = 0
+    wp_comment_wrappers = 0
+    comments_in_p = 0
+    
+    for p in soup.find_all("p"):
+        nested += len(p.find_all("p"))
+        flags = classify_p(p)
+        if flags & P_BLOCK_WRAPPED:
+            block_wraps += 1
         
-        for p in soup.find_all("p"):
-            nested += len(p.find_all("p"))
-            if any(isinstance(c, Tag) and c.name in BLOCK_LEVEL_TAGS for c in p.children):
-                block_wraps += 1
-            
-            # Check if empty
-            if is_effectively_empty(p):
-                empties += 1
-                # Check if it has span tags (even if empty)
-                if p.find("span"):
-                    empty_with_span += 1
-            
-            if p_is_wp_comment_wrapper(p):
-                wp_comment_wrappers += 1
-            
-            # Count WP comments inside p tags
-            for child in p.children:
-                if isinstance(child, Comment):
-                    comment_text = str(child).strip()
-                    if comment_text.startswith("wp:") or comment_text.startswith("/wp:"):
-                        comments_in_p += 1
+        # Check if empty
+        if flags & P_EMPTY:
+            empties += 1
+            # Check if it has span tags (even if empty)
+            if p.find("span"):
+                empty_with_span += 1
         
-        return {
-            "nested_p": nested,
-            "p_wrapping_blocks": block_wraps,
-            "empty_p": empties,
-            "empty_p_with_span": empty_with_span,
-            "wp_comment_wrappers": wp_comment_wrappers,
-            "wp_comments_in_p": comments_in_p
-        }
-    except Exception as e:
-        return {"error": str(e)}
+        if flags & P_WP_ONLY:
+            wp_comment_wrappers += 1
+        
+        # Count WP comments inside p tags
+        for child in p.children:
+            if isinstance(child, Comment) and is_wp_comment_text(child):
+                comments_in_p += 1
+    
+    return {
+        "nested_p": nested,
+        "p_wrapping_blocks": block_wraps,
+        "empty_p": empties,
+        "empty_p_with_span": empty_with_span,
+        "wp_comment_wrappers": wp_comment_wrappers,
+        "wp_comments_in_p": comments_in_p
+    }
 
+@st.cache_data(max_entries=32, show_spinner=False)
 def validate_html(html: str, parser: str) -> Dict:
     """Validate that HTML has been properly fixed."""
     try:
         soup = BeautifulSoup(html, parser)
-        issues = []
-        
-        # Check for nested <p> tags
-        for p in soup.find_all("p"):
-            if p.find("p"):
-                issues.append("Still contains nested <p> tags")
-                break
+        nested = block_wrapped = wp_comment_inside = False
         
-        # Check for <p> wrapping block elements
+        # One walk over the <p> tags; each check stops being tested once it has fired
         for p in soup.find_all("p"):
-            if any(isinstance(c, Tag) and c.name in BLOCK_LEVEL_TAGS for c in p.children):
-                issues.append("Still has <p> wrapping block elements")
+            # Check for nested <p> tags
+            if not nested and p.find("p"):
+                nested = True
+            
+            # Check for <p> wrapping block elements / WP comments inside <p> tags
+            if not (block_wrapped and wp_comment_inside):
+                for c in p.children:
+                    if isinstance(c, Tag):
+                        if c.name in BLOCK_LEVEL_TAGS:
+                            block_wrapped = True
+                    elif isinstance(c, Comment) and is_wp_comment_text(c):
+                        wp_comment_inside = True
+            
+            if nested and block_wrapped and wp_comment_inside:
                 break
         
-        # Check for WP comments inside <p> tags
-        for p in soup.find_all("p"):
-            for child in p.children:
-                if isinstance(child, Comment):
-                    comment_text = str(child).strip()
-                    if comment_text.startswith("wp:") or comment_text.startswith("/wp:"):
-                        issues.append("Still has Gutenberg comments inside <p> tags")
-                        break
-            if issues and "Gutenberg comments" in issues[-1]:
-                break
+        issues = []
+        if nested:
+            issues.append("Still contains nested <p> tags")
+        if block_wrapped:
+            issues.append("Still has <p> wrapping block elements")
+        if wp_comment_inside:
+            issues.append("Still has Gutenberg comments inside <p> tags")
         
         return {
             "valid": len(issues) == 0,
@@ -402,113 +467,223 @@ def serialize_fragment(soup: BeautifulSoup, strip_document_wrapper: bool = True,
     """
     def to_html(node) -> str:
         if isinstance(node, Comment):
-            comment_text = str(node).strip()
+            comment_text = node.strip()  # Comment is a str: no str() copy needed
             # Fix: Remove extra spaces in Gutenberg comments
-            if comment_text.startswith("wp:") or comment_text.startswith("/wp:"):
+            if is_wp_comment_text(comment_text):
                 # Return without extra spaces
                 return f"<!--{comment_text}-->"
             return f"<!-- {comment_text} -->"
         return str(node)
 
-    if strip_document_wrapper and getattr(soup, "body", None):
+    def to_pretty_html(node) -> str:
+        if isinstance(node, Tag):
+            return node.prettify()
+        if isinstance(node, Comment):
+            return to_html(node) + "\n"
+        return node.output_ready().strip() + "\n"
+
+    body = getattr(soup, "body", None) if strip_document_wrapper else None
+    if prettify:
+        # Pretty-print the tree we already have instead of re-parsing the output.
+        # Merge the adjacent text nodes left by comment extraction, as a re-parse would.
+        # A stripped fragment puts each top-level node on its own line, so only
+        # smooth inside its tags.
+        for scope in (body.find_all(True, recursive=False) if body else [soup]):
+            scope.smooth()
+        # html5lib keeps <!----> as an empty comment where html.parser and lxml read
+        # a single space; print it as <!-- --> like the other parsers do.
+        for comment in [d for d in soup.descendants if type(d) is Comment and not d]:
+            comment.replace_with(Comment(" "))
+
+    if body:
         parts = []
-        for node in soup.body.children:
-            if isinstance(node, NavigableString) and not str(node).strip():
+        for node in body.children:
+            if isinstance(node, NavigableString) and is_blank_text(node):
                 continue
-            parts.append(to_html(node))
-        html = "\n".join(parts).strip()
+            parts.append(to_pretty_html(node) if prettify else to_html(node))
+        html = "".join(parts) if prettify else "\n".join(parts).strip()
     else:
-        html = str(soup)
+        html = soup.prettify() if prettify else str(soup)
 
     # Additional regex cleanup for any remaining malformed comments
     # Fix: <!--  wp:  --> to <!-- wp: -->
-    html = re.sub(r'<!--\s+(/?wp:[^>]+?)\s+-->', r'<!--\1-->', html)
+    return WP_COMMENT_SPACING_RE.sub(r'<!--\1-->', html)
+
+def _fix_soup(
+    soup: BeautifulSoup,
+    remove_empty: bool,
+    unwrap_block_wrapped_p: bool,
+    prettify: bool,
+    strip_document_wrapper: bool
+) -> Tuple[str, Dict]:
+    """Apply all fixes to a parsed tree (mutating it) and return (fixed_html, stats)."""
+    stats = normalize_paragraphs(
+        soup,
+        remove_empty=remove_empty,
+        unwrap_block_wrapped_p=unwrap_block_wrapped_p
+    )
+
+    # Remove empty Gutenberg blocks
+    stats["empty_wp_blocks_removed"] = remove_empty_gutenberg_blocks(soup)
+
+    fixed = serialize_fragment(
+        soup,
+        strip_document_wrapper=strip_document_wrapper,
+        prettify=prettify
+    )
     
-    if prettify:
-        return BeautifulSoup(html, "html.parser").prettify()
-    return html
+    # FINAL CLEANUP: Simple find-and-replace to remove unwanted patterns
+    # This catches edge cases that might have been missed
+    # subn() reports how many were removed, so no extra passes are needed for the stats
+    
+    # 1. Remove empty p-span tags
+    fixed, loose_span = EMPTY_P_SPAN_RE.subn('', fixed)
+    fixed, tight_span = EMPTY_P_SPAN_TIGHT_RE.subn('', fixed)
+    
+    # 2. Remove consecutive Gutenberg comment pairs
+    # Pattern: <!--/wp:paragraph-->\n<!-- wp:paragraph -->
+    fixed, tight_pairs = WP_PARAGRAPH_PAIR_TIGHT_RE.subn('', fixed)
+    fixed, loose_pairs = WP_PARAGRAPH_PAIR_RE.subn('', fixed)
+    
+    # Count how many were removed in final cleanup
+    empty_span_count = loose_span + tight_span
+    comment_pairs_removed = tight_pairs + loose_pairs
+    
+    if empty_span_count > 0:
+        stats["final_cleanup_empty_span"] = empty_span_count
+    if comment_pairs_removed > 0:
+        stats["final_cleanup_comment_pairs"] = comment_pairs_removed
+    
+    return fixed, stats
 
-def fix_html_content(
+@st.cache_data(max_entries=32, show_spinner=False)
+def fix_and_analyze(
     html: str,
     remove_empty: bool = True,
     unwrap_block_wrapped_p: bool = True,
     prettify: bool = False,
     parser: str | None = None,
     strip_document_wrapper: bool = True
-) -> Tuple[str, Dict, str]:
-    """Main fix function with error handling."""
+) -> Tuple[str, Dict, Dict, str]:
+    """
+    Main fix function with error handling: analyzes and fixes one parse of the input.
+    Returns (fixed_html, before_stats, after_stats, parser); problems are reported in after_stats.
+    """
+    parser = parser or pick_parser()
     try:
         # Validate input
         if not html or not html.strip():
-            return html, {"error": "Empty HTML provided"}, parser or pick_parser()
+            return html, {}, {"error": "Empty HTML provided"}, parser
         
         if len(html) < 10:
-            return html, {"warning": "HTML seems too short - might be incomplete"}, parser or pick_parser()
-        
-        parser = parser or pick_parser()
-        soup = BeautifulSoup(html, parser)
+            return html, {}, {"warning": "HTML seems too short - might be incomplete"}, parser
 
-        stats = normalize_paragraphs(
+        soup = BeautifulSoup(html, parser)
+        before_stats = analyze_soup(soup)  # must run before the tree is mutated
+        fixed, after_stats = _fix_soup(
             soup,
             remove_empty=remove_empty,
-            unwrap_block_wrapped_p=unwrap_block_wrapped_p
+            unwrap_block_wrapped_p=unwrap_block_wrapped_p,
+            prettify=prettify,
+            strip_document_wrapper=strip_document_wrapper
         )
+        return fixed, before_stats, after_stats, parser
 
-        # Remove empty Gutenberg blocks
-        stats["empty_wp_blocks_removed"] = remove_empty_gutenberg_blocks(soup)
-
-        fixed = serialize_fragment(
-            soup,
-            strip_document_wrapper=strip_document_wrapper,
-            prettify=prettify
-        )
-        
-        # FINAL CLEANUP: Simple find-and-replace to remove unwanted patterns
-        # This catches edge cases that might have been missed
-        before_final_cleanup = fixed
-        
-        # 1. Remove empty p-span tags
-        fixed = re.sub(r'<p>\s*<span>\s*</span>\s*</p>\s*', '', fixed)
-        fixed = re.sub(r'<p><span></span></p>\s*', '', fixed)
-        
-        # 2. Remove consecutive Gutenberg comment pairs
-        # Pattern: <!--/wp:paragraph-->\n<!-- wp:paragraph -->
-        fixed = re.sub(r'<!--/wp:paragraph-->\s*<!--\s*wp:paragraph\s*-->', '', fixed)
-        fixed = re.sub(r'<!--\s*/wp:paragraph\s*-->\s*<!--\s*wp:paragraph\s*-->', '', fixed)
-        
-        # Count how many were removed in final cleanup
-        empty_span_count = before_final_cleanup.count('<p><span></span></p>')
-        comment_pairs_removed = before_final_cleanup.count('<!--/wp:paragraph-->') - fixed.count('<!--/wp:paragraph-->')
-        
-        if empty_span_count > 0:
-            stats["final_cleanup_empty_span"] = empty_span_count
-        if comment_pairs_removed > 0:
-            stats["final_cleanup_comment_pairs"] = comment_pairs_removed
-        
-        return fixed, stats, parser
-    
     except Exception as e:
-        return html, {"error": f"Processing failed: {str(e)}"}, parser or pick_parser()
+        return html, {}, {"error": f"Processing failed: {str(e)}"}, parser
 
+def fix_html_content(
+    html: str,
+    remove_empty: bool = True,
+    unwrap_block_wrapped_p: bool = True,
+    prettify: bool = False,
+    parser: str | None = None,
+    strip_document_wrapper: bool = True
+) -> Tuple[str, Dict, str]:
+    """fix_and_analyze() without the before-stats: returns (fixed_html, stats, parser)."""
+    fixed, _, stats, used_parser = fix_and_analyze(
+        html,
+        remove_empty=remove_empty,
+        unwrap_block_wrapped_p=unwrap_block_wrapped_p,
+        prettify=prettify,
+        parser=parser,
+        strip_document_wrapper=strip_document_wrapper
+    )
+    return fixed, stats, used_parser
+
+def _common_prefix_len(a: str, b: str) -> int:
+    """Length of the common prefix of a and b (compared a fixed-size chunk at a time)."""
+    limit = min(len(a), len(b))
+    i = 0
+    while i < limit and a[i:i + DIFF_SUMMARY_CHUNK] == b[i:i + DIFF_SUMMARY_CHUNK]:
+        i += DIFF_SUMMARY_CHUNK
+    while i < limit and a[i] == b[i]:
+        i += 1
+    return min(i, limit)
+
+def _common_suffix_len(a: str, b: str, limit: int) -> int:
+    """Length of the common suffix of a and b, at most limit (chunked like the prefix)."""
+    n = 0
+    while n + DIFF_SUMMARY_CHUNK <= limit and (
+        a[len(a) - n - DIFF_SUMMARY_CHUNK:len(a) - n] == b[len(b) - n - DIFF_SUMMARY_CHUNK:len(b) - n]
+    ):
+        n += DIFF_SUMMARY_CHUNK
+    while n < limit and a[-n - 1] == b[-n - 1]:
+        n += 1
+    return n
+
+def summarize_changes(original: str, fixed: str) -> str:
+    """
+    Linear-time stand-in for a diff of large inputs: hashes of both sides and
+    the single character range that contains every change.
+    """
+    lines = [
+        f"Original: {len(original):,} chars, md5 {hashlib.md5(original.encode()).hexdigest()}",
+        f"Fixed:    {len(fixed):,} chars, md5 {hashlib.md5(fixed.encode()).hexdigest()}",
+    ]
+    if original == fixed:
+        lines.append("No differences found")
+        return "\n".join(lines)
+
+    prefix = _common_prefix_len(original, fixed)
+    suffix = _common_suffix_len(original, fixed, min(len(original), len(fixed)) - prefix)
+    changed = len(original) - prefix - suffix
+    lines.append(
+        f"Changed region: chars {prefix:,}-{prefix + changed:,} of the original "
+        f"({changed:,} chars) became {len(fixed) - prefix - suffix:,} chars"
+    )
+    return "\n".join(lines)
+
+@st.cache_data(max_entries=32, show_spinner=False)
 def generate_diff(original: str, fixed: str, max_lines: int = 50) -> str:
     """Generate a unified diff between original and fixed HTML."""
+    size = max(len(original), len(fixed))
     try:
-        diff = list(difflib.unified_diff(
+        if size > MAX_DIFF_SIZE:
+            return (
+                f"Diff skipped: input is too large ({size / 1024:.0f}KB), showing a summary instead\n"
+                + summarize_changes(original, fixed)
+            )
+        lines = difflib.unified_diff(
             original.splitlines(keepends=True),
             fixed.splitlines(keepends=True),
             fromfile='Original',
             tofile='Fixed',
             lineterm=''
-        ))
+        )
         
-        if len(diff) > max_lines:
-            diff = diff[:max_lines] + [f'\n... (truncated, {len(diff) - max_lines} more lines)']
+        # Keep only what is shown; the rest is just counted
+        diff = list(itertools.islice(lines, max_lines))
+        remaining = sum(1 for _ in lines)
+        if remaining:
+            diff.append(f'\n... (truncated, {remaining} more lines)')
         
         return ''.join(diff) if diff else "No differences found"
     except Exception as e:
         return f"Error generating diff: {str(e)}"
 
 # ---------------- Test Cases ----------------
+@st.cache_data(show_spinner=False)
 def run_tests() -> Dict[str, bool]:
     """Run test cases to verify functionality."""
     test_cases = {
@@ -540,6 +715,25 @@ def run_tests() -> Dict[str, bool]:
             "input": "<p>Text<!-- wp:paragraph -->more text</p>",
             "check": lambda fixed: "<p>Text<!--" not in fixed and "<!--wp:paragraph-->" in fixed
         },
+        "wp_comment_kept_from_nested_p": {
+            "input": '<p>\n<p><!--  wp:heading {"level":2}  -->',
+            "options": {"parser": "html.parser"},
+            "check": lambda fixed: '<!--wp:heading {"level":2}-->' in fixed
+        },
+        "blank_comment_p_removed": {
+            "input": "<p><!----></p><p>Content</p>",
+            "options": {"remove_empty": False},
+            "check": lambda fixed: fixed == "<p>Content</p>"
+        },
+        "prettify_empty_comment": {
+            "input": "<p>a<!----></p>",
+            "options": {"parser": "html5lib", "prettify": True},
+            "check": lambda fixed: fixed == "<p>\n a\n <!-- -->\n</p>\n"
+        },
+        "wp_comment_order_kept": {
+            "input": "<p>Text<!-- /wp:heading --><!-- wp:list -->more</p>",
+            "check": lambda fixed: 0 <= fixed.find("<!--/wp:heading-->") < fixed.find("<!--wp:list-->")
+        },
         "wp_comment_spacing": {
             "input": "<!--  wp:paragraph  --><p>Content</p><!--  /wp:paragraph  -->",
             "check": lambda fixed: "<!--wp:paragraph-->" in fixed and "<!--/wp:paragraph-->" in fixed
@@ -553,11 +747,13 @@ def run_tests() -> Dict[str, bool]:
     results = {}
     for name, test in test_cases.items():
         try:
-            fixed, _, _ = fix_html_content(test["input"])
+            fixed, _, _ = fix_html_content(test["input"], **test.get("options", {}))
             results[name] = test["check"](fixed)
         except Exception:
             results[name] = False
     
+    # generate_diff() runs on every rerun with the diff view open; keep it memoized
+    results["generate_diff_cached"] = hasattr(generate_diff, "clear")
     return results
 
 # ---------------- UI ----------------
@@ -571,9 +767,14 @@ st.markdown(
 
 st.info("🆕 **New Features**: Automatically extracts Gutenberg comments from inside `<p>` tags, removes extra spaces in comment syntax, **performs final cleanup to remove all `<p><span></span></p>` tags AND consecutive Gutenberg comment pairs!**")
 
-with st.expander("📦 System Status", expanded=False):
+with st.expander("📦 System Status", expanded="lxml" not in PARSER_ORDER):
     st.write("**Parsers (best → fallback):**", ", ".join(PARSER_ORDER))
     st.success("✅ BeautifulSoup available")
+    if "lxml" not in PARSER_ORDER:
+        st.warning(
+            f"⚠️ lxml is not installed - falling back to `{pick_parser()}`, which is several times slower. "
+            "Add `lxml==5.3.0` to `requirements.txt` and reboot the app."
+        )
     st.info(f"**Max file size:** {MAX_FILE_SIZE / (1024*1024):.0f}MB")
 
 # Sidebar - Presets
@@ -609,6 +810,8 @@ with st.sidebar.expander("🔬 Advanced Options"):
     show_validation = st.checkbox("Show validation results", value=True)
     show_diff = st.checkbox("Show before/after diff", value=False)
     run_test_suite = st.checkbox("Run test suite", value=False)
+    if st.button("🧹 Clear cached results", help="Results are cached per input and options; clear to force a re-run"):
+        st.cache_data.clear()
 
 st.sidebar.markdown("---")
 st.sidebar.caption("Enhanced version with Gutenberg comment fix + final regex cleanup • v2.3")
@@ -619,21 +822,23 @@ col1, col2 = st.columns([1, 1])
 # -------- Left: Input --------
 with col1:
     st.subheader("📝 Input HTML")
-    input_html = st.text_area(
-        "Paste your HTML:",
-        height=320,
-        placeholder="Paste WordPress HTML content here…",
-        help="Paste the HTML content that needs fixing"
-    )
+    # A form batches input edits: the script only reruns the fix on submit
+    with st.form("fix_form", border=False):
+        input_html = st.text_area(
+            "Paste your HTML:",
+            height=320,
+            placeholder="Paste WordPress HTML content here…",
+            help="Paste the HTML content that needs fixing"
+        )
 
-    uploaded_files = st.file_uploader(
-        "…or upload .html/.htm/.txt files",
-        type=["html", "htm", "txt"],
-        accept_multiple_files=True,
-        help="Upload one or more HTML files for batch processing"
-    )
+        uploaded_files = st.file_uploader(
+            "…or upload .html/.htm/.txt files",
+            type=["html", "htm", "txt"],
+            accept_multiple_files=True,
+            help="Upload one or more HTML files for batch processing"
+        )
 
-    run_btn = st.button("🚀 Fix HTML", type="primary", use_container_width=True)
+        run_btn = st.form_submit_button("🚀 Fix HTML", type="primary", use_container_width=True)
 
 # -------- Right: Output --------
 with col2:
@@ -674,16 +879,14 @@ with col2:
                     st.warning(f"⚠️ {f.name} is very large ({file_size/1024/1024:.1f}MB). Processing may be slow.")
                 
                 try:
-                    raw = f.read().decode("utf-8", errors="replace")
+                    raw = f.getvalue().decode("utf-8", errors="replace")
                     
                     # Malformed HTML check
                     if not raw or len(raw) < 10:
                         st.error(f"❌ {f.name}: File is empty or too short")
                         continue
                     
-                    before_stats = analyze_issues(raw, pick_parser() if selected_parser is None else selected_parser)
-                    
-                    fixed, after_stats, used_parser = fix_html_content(
+                    fixed, before_stats, after_stats, used_parser = fix_and_analyze(
                         raw,
                         remove_empty=remove_empty_opt,
                         unwrap_block_wrapped_p=unwrap_block_opt,
@@ -728,8 +931,11 @@ with col2:
                             st.json(before_stats)
                             if len(raw) > FULL_DISPLAY_THRESHOLD:
                                 st.code(raw[:PREVIEW_LENGTH] + "\n\n... (preview truncated) ...", language="html")
-                                with st.expander("View full original"):
-                                    st.code(raw, language="html")
+                                if len(raw) <= MAX_FULL_RENDER_SIZE:
+                                    with st.expander("View full original"):
+                                        st.code(raw, language="html" if len(raw) <= MAX_HIGHLIGHT_SIZE else None)
+                                else:
+                                    st.caption("Too large to show in full")
                             else:
                                 st.code(raw, language="html")
                         
@@ -738,8 +944,11 @@ with col2:
                             st.json(after_stats)
                             if len(fixed) > FULL_DISPLAY_THRESHOLD:
                                 st.code(fixed[:PREVIEW_LENGTH] + "\n\n... (preview truncated) ...", language="html")
-                                with st.expander("View full fixed"):
-                                    st.code(fixed, language="html")
+                                if len(fixed) <= MAX_FULL_RENDER_SIZE:
+                                    with st.expander("View full fixed"):
+                                        st.code(fixed, language="html" if len(fixed) <= MAX_HIGHLIGHT_SIZE else None)
+                                else:
+                                    st.caption("Too large to show in full - use the download button below")
                             else:
                                 st.code(fixed, language="html")
                         
@@ -794,102 +1003,100 @@ with col2:
                 if len(input_html) < 10:
                     st.warning("⚠️ HTML seems too short - might be incomplete")
                 
-                before_stats = analyze_issues(input_html, pick_parser() if selected_parser is None else selected_parser)
+                fixed_html, before_stats, after_stats, used_parser = fix_and_analyze(
+                    input_html,
+                    remove_empty=remove_empty_opt,
+                    unwrap_block_wrapped_p=unwrap_block_opt,
+                    prettify=prettify_opt,
+                    parser=selected_parser,
+                    strip_document_wrapper=strip_wrapper_opt
+                )
                 
-                if "error" in before_stats:
-                    st.error(f"❌ Error analyzing HTML: {before_stats['error']}")
+                # Check for errors
+                if "error" in after_stats:
+                    st.error(f"❌ {after_stats['error']}")
+                elif "warning" in after_stats:
+                    st.warning(f"⚠️ {after_stats['warning']}")
                 else:
-                    fixed_html, after_stats, used_parser = fix_html_content(
-                        input_html,
-                        remove_empty=remove_empty_opt,
-                        unwrap_block_wrapped_p=unwrap_block_opt,
-                        prettify=prettify_opt,
-                        parser=selected_parser,
-                        strip_document_wrapper=strip_wrapper_opt
+                    # Success message with metrics
+                    empty_span_cleanup = after_stats.get('final_cleanup_empty_span', 0)
+                    comment_pairs_cleanup = after_stats.get('final_cleanup_comment_pairs', 0)
+                    
+                    success_msg = (
+                        f"✅ **Fixed successfully!** • "
+                        f"Nested `<p>`: **{after_stats['nested_p_fixed']}** • "
+                        f"Unwrapped blocks: **{after_stats['block_wraps_unwrapped']}** • "
+                        f"Empty `<p>`: **{after_stats['empty_p_removed']}** • "
+                        f"WP-comment-only `<p>`: **{after_stats['wp_comment_wrapper_removed']}** • "
+                        f"Empty WP blocks: **{after_stats['empty_wp_blocks_removed']}** • "
+                        f"Comments extracted: **{after_stats['comments_extracted_from_p']}**"
                     )
                     
-                    # Check for errors
-                    if "error" in after_stats:
-                        st.error(f"❌ {after_stats['error']}")
-                    elif "warning" in after_stats:
-                        st.warning(f"⚠️ {after_stats['warning']}")
-                    else:
-                        # Success message with metrics
-                        empty_span_cleanup = after_stats.get('final_cleanup_empty_span', 0)
-                        comment_pairs_cleanup = after_stats.get('final_cleanup_comment_pairs', 0)
-                        
-                        success_msg = (
-                            f"✅ **Fixed successfully!** • "
-                            f"Nested `<p>`: **{after_stats['nested_p_fixed']}** • "
-                            f"Unwrapped blocks: **{after_stats['block_wraps_unwrapped']}** • "
-                            f"Empty `<p>`: **{after_stats['empty_p_removed']}** • "
-                            f"WP-comment-only `<p>`: **{after_stats['wp_comment_wrapper_removed']}** • "
-                            f"Empty WP blocks: **{after_stats['empty_wp_blocks_removed']}** • "
-                            f"Comments extracted: **{after_stats['comments_extracted_from_p']}**"
-                        )
-                        
-                        # Add final cleanup stats if any
-                        cleanup_parts = []
-                        if empty_span_cleanup > 0:
-                            cleanup_parts.append(f"**{empty_span_cleanup}** `<p><span></span></p>`")
-                        if comment_pairs_cleanup > 0:
-                            cleanup_parts.append(f"**{comment_pairs_cleanup}** comment pairs")
-                        
-                        if cleanup_parts:
-                            success_msg += f" • Final cleanup: {' + '.join(cleanup_parts)} removed"
-                        
-                        success_msg += f" • Parser: `{used_parser}` • Passes: {after_stats['iterations']}"
-                        
-                        st.success(success_msg)
-                        
-                        # Validation
-                        if show_validation:
-                            validation = validate_html(fixed_html, used_parser)
-                            if validation['valid']:
-                                st.success("✅ Validation: " + ", ".join(validation['issues']))
-                            else:
-                                st.error("❌ Validation: " + ", ".join(validation['issues']))
-                        
-                        st.markdown("---")
-                        
-                        # Metrics dashboard
-                        metric_cols = st.columns(5)
-                        with metric_cols[0]:
-                            st.metric("Before: Nested <p>", before_stats.get('nested_p', 0))
-                        with metric_cols[1]:
-                            st.metric("Before: Empty <p>", before_stats.get('empty_p', 0))
-                        with metric_cols[2]:
-                            st.metric("Before: <p> with <span>", before_stats.get('empty_p_with_span', 0))
-                        with metric_cols[3]:
-                            st.metric("Before: Block wraps", before_stats.get('p_wrapping_blocks', 0))
-                        with metric_cols[4]:
-                            st.metric("Before: Comments in <p>", before_stats.get('wp_comments_in_p', 0))
-                        
-                        st.markdown("---")
-                        st.markdown("**📤 Output (Gutenberg-safe fragment):**")
-                        
-                        if len(fixed_html) > FULL_DISPLAY_THRESHOLD:
-                            st.code(fixed_html[:PREVIEW_LENGTH] + "\n\n... (preview truncated) ...", language="html")
+                    # Add final cleanup stats if any
+                    cleanup_parts = []
+                    if empty_span_cleanup > 0:
+                        cleanup_parts.append(f"**{empty_span_cleanup}** `<p><span></span></p>`")
+                    if comment_pairs_cleanup > 0:
+                        cleanup_parts.append(f"**{comment_pairs_cleanup}** comment pairs")
+                    
+                    if cleanup_parts:
+                        success_msg += f" • Final cleanup: {' + '.join(cleanup_parts)} removed"
+                    
+                    success_msg += f" • Parser: `{used_parser}` • Passes: {after_stats['iterations']}"
+                    
+                    st.success(success_msg)
+                    
+                    # Validation
+                    if show_validation:
+                        validation = validate_html(fixed_html, used_parser)
+                        if validation['valid']:
+                            st.success("✅ Validation: " + ", ".join(validation['issues']))
+                        else:
+                            st.error("❌ Validation: " + ", ".join(validation['issues']))
+                    
+                    st.markdown("---")
+                    
+                    # Metrics dashboard
+                    metric_cols = st.columns(5)
+                    with metric_cols[0]:
+                        st.metric("Before: Nested <p>", before_stats.get('nested_p', 0))
+                    with metric_cols[1]:
+                        st.metric("Before: Empty <p>", before_stats.get('empty_p', 0))
+                    with metric_cols[2]:
+                        st.metric("Before: <p> with <span>", before_stats.get('empty_p_with_span', 0))
+                    with metric_cols[3]:
+                        st.metric("Before: Block wraps", before_stats.get('p_wrapping_blocks', 0))
+                    with metric_cols[4]:
+                        st.metric("Before: Comments in <p>", before_stats.get('wp_comments_in_p', 0))
+                    
+                    st.markdown("---")
+                    st.markdown("**📤 Output (Gutenberg-safe fragment):**")
+                    
+                    if len(fixed_html) > FULL_DISPLAY_THRESHOLD:
+                        st.code(fixed_html[:PREVIEW_LENGTH] + "\n\n... (preview truncated) ...", language="html")
+                        if len(fixed_html) <= MAX_FULL_RENDER_SIZE:
                             with st.expander("📖 View full output", expanded=False):
-                                st.code(fixed_html, language="html")
+                                st.code(fixed_html, language="html" if len(fixed_html) <= MAX_HIGHLIGHT_SIZE else None)
                         else:
-                            st.code(fixed_html, language="html")
-                        
-                        # Diff view
-                        if show_diff:
-                            st.markdown("---")
-                            st.markdown("**🔍 Changes (Diff)**")
-                            diff_result = generate_diff(input_html, fixed_html)
-                            st.code(diff_result, language="diff")
+                            st.caption("Too large to show in full - use the download button below")
+                    else:
+                        st.code(fixed_html, language="html")
+                    
+                    # Diff view
+                    if show_diff:
+                        st.markdown("---")
+                        st.markdown("**🔍 Changes (Diff)**")
+                        diff_result = generate_diff(input_html, fixed_html)
+                        st.code(diff_result, language="diff")
 
-                        st.download_button(
-                            label="📥 Download Fixed HTML",
-                            data=fixed_html,
-                            file_name="fixed_wordpress_content.html",
-                            mime="text/html",
-                            use_container_width=True
-                        )
-            
+                    st.download_button(
+                        label="📥 Download Fixed HTML",
+                        data=fixed_html,
+                        file_name="fixed_wordpress_content.html",
+                        mime="text/html",
+                        use_container_width=True
+                    )
+        
             except Exception as e:
                 st.error(f"❌ Unexpected error: {str(e)}")
         